@@ -0,0 +1,242 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+import aiohttp
+import asyncpg
+from aiohttp import web
+from dotenv import load_dotenv
+
+import rarity_summary
+import schema
+from strava_activities import (ACTIVITY_COLUMNS, MALFORMED_ACTIVITY_ERRORS,
+                               MAX_ACTIVITIES, PER_PAGE, SCORE_INDEX, STRAVA_API,
+                               activity_values, is_mapped_run)
+
+load_dotenv()
+
+CLIENT_ID = os.getenv("CLIENT_ID")
+CLIENT_SECRET = os.getenv("CLIENT_SECRET")
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Upper bound on open sockets to Strava shared by every in-flight athlete
+MAX_CONNECTIONS = int(os.getenv("STRAVA_MAX_CONNECTIONS", 100))
+
+# Postgres types of the activities columns, for the unnest() arrays below
+COLUMN_TYPES = {
+    "user_id": "bigint", "activity_id": "bigint", "name": "text",
+    "distance": "float8", "moving_time": "int", "elapsed_time": "int",
+    "total_elevation_gain": "float8", "type": "text",
+    "start_date": "timestamp", "start_date_local": "timestamp",
+    "start_latitude": "float8", "start_longitude": "float8",
+    "end_latitude": "float8", "end_longitude": "float8", "polyline": "text",
+    "average_speed": "float8", "max_speed": "float8",
+    "average_heartrate": "float8", "max_heartrate": "float8",
+    "calories": "float8", "rarity_score": "float8",
+}
+
+# One statement per athlete: each parameter is a whole column as an array
+INSERT_ACTIVITIES_SQL = f'''
+    INSERT INTO activities ({", ".join(ACTIVITY_COLUMNS)})
+    SELECT * FROM unnest({", ".join(f"${i + 1}::{COLUMN_TYPES[column]}[]"
+                                    for i, column in enumerate(ACTIVITY_COLUMNS))})
+    ON CONFLICT (user_id, activity_id) DO NOTHING
+    RETURNING activity_id
+'''
+
+# Created on app startup, shared by all requests in the process
+pool = None
+session = None
+
+
+async def startup(application):
+    global pool, session
+    pool = await asyncpg.create_pool(DATABASE_URL, ssl="require")
+    # The server may be started against a database main.py has never seen
+    await schema.migrate_async(pool)
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+        timeout=aiohttp.ClientTimeout(total=5))
+    logging.info("Async ingestion pool and HTTP session ready")
+
+
+async def shutdown(application):
+    if session:
+        await session.close()
+    if pool:
+        await pool.close()
+
+
+async def get_tokens(user_id):
+    return await pool.fetchrow('SELECT * FROM users WHERE user_id = $1', user_id)
+
+
+async def store_tokens(user_id, access_token, refresh_token, expires_at):
+    await pool.execute('''
+        INSERT INTO users (user_id, access_token, refresh_token, expires_at)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id) DO UPDATE
+        SET access_token = EXCLUDED.access_token,
+            refresh_token = EXCLUDED.refresh_token,
+            expires_at = EXCLUDED.expires_at
+    ''', user_id, access_token, refresh_token, expires_at)
+
+
+async def refresh_token_if_needed(user_id, tokens):
+    """
+    Return a valid access token for the user, refreshing it if it has
+    expired, or None if the refresh failed.
+    """
+    if tokens["expires_at"] >= time.time():
+        return tokens["access_token"]
+
+    async with session.post(f"{STRAVA_API}/oauth/token", data={
+        "client_id": CLIENT_ID,
+        "client_secret": CLIENT_SECRET,
+        "grant_type": "refresh_token",
+        "refresh_token": tokens["refresh_token"]
+    }) as r:
+        if r.status != 200:
+            return None
+        new_tokens = await r.json()
+
+    await store_tokens(user_id,
+                       new_tokens["access_token"],
+                       new_tokens["refresh_token"],
+                       new_tokens["expires_at"])
+    return new_tokens["access_token"]
+
+
+async def fetch_activity_pages(access_token, base_url=STRAVA_API, http=None):
+    """
+    Page through the athlete's activities, up to MAX_ACTIVITIES.
+    Pages are fetched one after another for a single athlete (to stay within
+    Strava's rate limits) but the awaits let other athletes' paging proceed.
+    """
+    http = http or session
+    headers = {"Authorization": f"Bearer {access_token}"}
+    params = {"per_page": PER_PAGE, "page": 1}
+    activities = []
+
+    while len(activities) < MAX_ACTIVITIES:
+        async with http.get(f"{base_url}/athlete/activities",
+                            headers=headers, params=params) as resp:
+            if resp.status != 200:
+                logging.error("Failed to fetch activities")
+                break
+            chunk = await resp.json()
+        if not chunk:
+            break
+        activities.extend(chunk)
+        params["page"] += 1
+
+    return activities
+
+
+def to_row(user_id, activity):
+    """activity_values() with start dates parsed, since asyncpg wants datetimes."""
+    row = list(activity_values(user_id, activity))
+    for column in ("start_date", "start_date_local"):
+        i = ACTIVITY_COLUMNS.index(column)
+        row[i] = datetime.strptime(row[i], rarity_summary.DATE_FORMAT)
+    return row
+
+
+def to_rows(user_id, activities):
+    """
+    (activity, row) pairs for the user's mapped runs. Malformed activities
+    are logged and skipped, like store_activity() in main.py.
+    """
+    rows = []
+    for activity in activities:
+        if not is_mapped_run(activity):
+            continue
+        try:
+            rows.append((activity, to_row(user_id, activity)))
+        except MALFORMED_ACTIVITY_ERRORS as e:
+            logging.error(f"Skipping malformed activity {activity.get('id')} "
+                          f"for user {user_id}: {e}")
+    return rows
+
+
+async def store_activities(user_id, activities):
+    rows = to_rows(user_id, activities)
+    if not rows:
+        return 0
+
+    # Inserts and the rarity summary update commit together, and only newly
+    # inserted activities are folded into the summary
+    columns = [list(column) for column in zip(*(row for _, row in rows))]
+    by_id = {activity["id"]: (activity, row[SCORE_INDEX]) for activity, row in rows}
+    async with pool.acquire() as db:
+        async with db.transaction():
+            inserted = await db.fetch(INSERT_ACTIVITIES_SQL, *columns)
+            scored = [rarity_summary.scored_entry(*by_id[r["activity_id"]])
+                      for r in inserted]
+            await rarity_summary.update_summary_async(db, user_id, scored)
+    return len(scored)
+
+
+async def ingest_user(user_id):
+    """
+    Async equivalent of the Flask /api/process-data route.
+    Returns (status, body) for the HTTP response.
+    """
+    tokens = await get_tokens(user_id)
+    if not tokens:
+        logging.error("User not authenticated")
+        return 401, {"error": "User not authenticated"}
+
+    access_token = await refresh_token_if_needed(user_id, tokens)
+    if not access_token:
+        logging.error("Token refresh failed")
+        return 401, {"error": "Token refresh failed"}
+
+    activities = await fetch_activity_pages(access_token)
+    stored = await store_activities(user_id, activities)
+
+    logging.info(f"Async ingestion complete for user {user_id}: {stored} runs")
+    return 200, {"message": "Data processing complete", "runs": stored}
+
+
+async def process_data(request):
+    user_id = request.query.get("user_id")
+    if not user_id or not user_id.isdigit():
+        logging.error("Missing user_id")
+        return web.json_response({"error": "Missing user_id"}, status=400)
+
+    logging.info(f"Async processing data for user {user_id}")
+    try:
+        status, body = await ingest_user(int(user_id))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error(f"Strava request failed for user {user_id}: {e}")
+        status, body = 502, {"error": "Strava request failed"}
+    except (asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+        logging.error(f"Database error for user {user_id}: {e}")
+        status, body = 500, {"error": "Database error"}
+    return web.json_response(body, status=status)
+
+
+def create_app():
+    """
+    Only /api/async/process-data is served here. The Flask routes in main.py
+    share one psycopg2 connection and must keep running under gunicorn's sync
+    workers. A failing startup hook aborts the server instead of serving
+    requests without a pool.
+    """
+    application = web.Application()
+    application.router.add_get("/api/async/process-data", process_data)
+    application.on_startup.append(startup)
+    application.on_cleanup.append(shutdown)
+    return application
+
+
+# Run with `gunicorn async_ingest:app --worker-class aiohttp.GunicornWebWorker`
+# or `python async_ingest.py`
+app = create_app()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(app, port=int(os.environ.get("PORT", 8001)))
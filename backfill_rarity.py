@@ -0,0 +1,96 @@
+"""
+One-time backfill for the per-athlete rarity summaries.
+
+Scores are based on the athlete's local start time (start_date_local), which
+older rows do not have. For every user with such rows this re-fetches their
+activities from Strava, stores start_date_local and scores them with
+rarity_summary.score_activity(), the same rule live ingestion uses. Rows that
+cannot be re-fetched (revoked access, outside the last MAX_ACTIVITIES) are
+left unscored rather than scored on UTC time, so one histogram never mixes
+the two. Every user's summary is then rebuilt from `activities`.
+
+Safe to re-run and to run while ingestion is live.
+
+Usage:
+    python backfill_rarity.py
+"""
+import logging
+
+import requests
+from psycopg2.extras import execute_batch
+
+import rarity_summary
+from main import conn, cursor, get_tokens, refresh_token_if_needed
+from strava_activities import (MALFORMED_ACTIVITY_ERRORS, fetch_activity_pages,
+                               is_mapped_run)
+
+
+def rescore_user(user_id):
+    """Re-fetch the user's activities and score the rows missing start_date_local."""
+    cursor.execute('''
+        SELECT activity_id FROM activities
+        WHERE user_id = %s AND start_date_local IS NULL
+    ''', (user_id,))
+    missing = {row["activity_id"] for row in cursor.fetchall()}
+
+    tokens = get_tokens(user_id)
+    if not tokens or not refresh_token_if_needed(user_id, tokens):
+        logging.error(f"No valid Strava token for user {user_id}, skipping")
+        return 0
+    tokens = get_tokens(user_id)  # Pick up a refreshed access token
+
+    updates = []
+    for activity in fetch_activity_pages(tokens["access_token"]):
+        if activity.get("id") not in missing or not is_mapped_run(activity):
+            continue
+        try:
+            updates.append((activity["start_date_local"],
+                            rarity_summary.score_activity(activity),
+                            user_id, activity["id"]))
+        except MALFORMED_ACTIVITY_ERRORS as e:
+            logging.error(f"Skipping malformed activity {activity.get('id')} "
+                          f"for user {user_id}: {e}")
+
+    execute_batch(cursor, '''
+        UPDATE activities SET start_date_local = %s, rarity_score = %s
+        WHERE user_id = %s AND activity_id = %s
+    ''', updates)
+    conn.commit()
+    return len(updates)
+
+
+def rescore_all():
+    cursor.execute('''
+        SELECT DISTINCT user_id FROM activities
+        WHERE user_id IS NOT NULL AND start_date_local IS NULL
+    ''')
+    for user_id in [row["user_id"] for row in cursor.fetchall()]:
+        try:
+            count = rescore_user(user_id)
+            logging.info(f"Rescored {count} activities for user {user_id}")
+        except requests.RequestException as e:
+            conn.rollback()
+            logging.error(f"Strava request failed for user {user_id}: {e}")
+
+    # Anything still without a local start time cannot be scored on the same
+    # scale, so it is dropped from the summaries instead
+    cursor.execute('''
+        UPDATE activities SET rarity_score = NULL
+        WHERE start_date_local IS NULL AND rarity_score IS NOT NULL
+    ''')
+    logging.info(f"Left {cursor.rowcount} activities without a local start time unscored")
+    conn.commit()
+
+
+def rebuild_all():
+    cursor.execute('SELECT DISTINCT user_id FROM activities WHERE user_id IS NOT NULL')
+    for user_id in [row["user_id"] for row in cursor.fetchall()]:
+        count = rarity_summary.rebuild_summary(cursor, user_id)
+        conn.commit()
+        logging.info(f"Rebuilt rarity summary for user {user_id} from {count} activities")
+
+
+if __name__ == "__main__":
+    # Importing main connects and creates the schema
+    rescore_all()
+    rebuild_all()
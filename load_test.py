@@ -0,0 +1,107 @@
+"""
+Load test: concurrent-athlete ingestion throughput, threaded vs asyncio.
+
+Starts a local fake Strava API that answers /athlete/activities with a fixed
+number of pages after a fixed latency, then pages N athletes through it with
+ - the threaded model: strava_activities.fetch_activity_pages (the loop the
+   Flask /api/process-data route runs) on a pool of `concurrency` threads, and
+ - the asyncio model: async_ingest.fetch_activity_pages on one aiohttp
+   session with at most `concurrency` athletes and connections in flight.
+Each concurrency level in the sweep is run with both models. The database is
+left out on purpose so only the Strava paging is measured.
+
+Usage:
+    python load_test.py --users 500 --concurrency 8,32,128 --pages 10 --latency 0.2
+"""
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+from aiohttp import web
+
+import async_ingest
+import strava_activities
+from strava_activities import PER_PAGE
+
+TOKEN = "load-test"
+
+
+def make_fake_strava(pages, latency):
+    activity = {"type": "Run", "map": {"summary_polyline": "_p~iF~ps|U_ulLnnqC"}}
+
+    async def activities(request):
+        await asyncio.sleep(latency)
+        page = int(request.query.get("page", 1))
+        return web.json_response([activity] * PER_PAGE if page <= pages else [])
+
+    fake = web.Application()
+    fake.router.add_get("/athlete/activities", activities)
+    return fake
+
+
+def serve_in_background(fake, port):
+    """Run the fake Strava API on its own event loop thread."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(fake)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port, backlog=1024).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+
+def fetch_threaded(base_url):
+    # A session per athlete so both models reuse connections across pages
+    with requests.Session() as http:
+        return len(strava_activities.fetch_activity_pages(
+            TOKEN, base_url=base_url, http=http, timeout=60))
+
+
+def run_threaded(base_url, users, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        total = sum(pool.map(lambda _: fetch_threaded(base_url), range(users)))
+    return total, time.perf_counter() - start
+
+
+async def run_async(base_url, users, concurrency):
+    start = time.perf_counter()
+    in_flight = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        async def fetch_async():
+            async with in_flight:
+                return len(await async_ingest.fetch_activity_pages(
+                    TOKEN, base_url=base_url, http=http))
+
+        counts = await asyncio.gather(*(fetch_async() for _ in range(users)))
+    return sum(counts), time.perf_counter() - start
+
+
+def report(label, concurrency, users, total, elapsed):
+    print(f"{label:<10} {concurrency:>5} in flight  {users:>6} users  {total:>8} activities  "
+          f"{elapsed:8.2f}s  {users / elapsed:8.1f} users/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", default="8,32,128",
+                        help="comma-separated athletes in flight, used for both models")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="seconds the fake Strava API waits per page")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    serve_in_background(make_fake_strava(args.pages, args.latency), args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        report("threaded", concurrency, args.users,
+               *run_threaded(base_url, args.users, concurrency))
+        report("asyncio", concurrency, args.users,
+               *asyncio.run(run_async(base_url, args.users, concurrency)))
@@ -8,6 +8,11 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 import logging
+import rarity_summary
+import schema
+from strava_activities import (ACTIVITY_COLUMNS, MALFORMED_ACTIVITY_ERRORS,
+                               SCORE_INDEX, activity_values,
+                               fetch_activity_pages, is_mapped_run)
 
 load_dotenv()
 app = Flask(__name__)
@@ -30,40 +35,7 @@ try:
 except Exception as e:
     raise RuntimeError("DB connection failed: " + str(e))
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    user_id BIGINT PRIMARY KEY,
-    access_token TEXT NOT NULL,
-    refresh_token TEXT NOT NULL,
-    expires_at BIGINT NOT NULL
-)
-''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS activities (
-    user_id BIGINT REFERENCES users(user_id),
-    activity_id BIGINT PRIMARY KEY,
-    name TEXT,
-    distance FLOAT,
-    moving_time INT,
-    elapsed_time INT,
-    total_elevation_gain FLOAT,
-    type TEXT,
-    start_date TIMESTAMP,
-    start_latitude FLOAT,
-    start_longitude FLOAT,
-    end_latitude FLOAT,
-    end_longitude FLOAT,
-    polyline TEXT,
-    average_speed FLOAT,
-    max_speed FLOAT,
-    average_heartrate FLOAT,
-    max_heartrate FLOAT,
-    calories FLOAT,
-    UNIQUE(user_id, activity_id)
-)
-''')
+schema.migrate(cursor)
 conn.commit()
 
 
@@ -333,66 +305,130 @@ def process_data():
         logging.error("Token refresh failed")
         return jsonify({"error": "Token refresh failed"}), 401
 
-    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
-    url = "https://www.strava.com/api/v3/athlete/activities"
-    params = {"per_page": 100, "page": 1}
-    activities = []
-
-    while len(activities) < 1000:
-        logging.info(f"Fetching page {params['page']} for user {user_id}")
-        resp = requests.get(url, headers=headers, params=params, timeout=5)
-        if resp.status_code != 200:
-            logging.error("Failed to fetch activities")
-            break
-        chunk = resp.json()
-        if not chunk:
-            break
-        activities.extend(chunk)
-        params["page"] += 1
+    logging.info(f"Fetching activities for user {user_id}")
+    activities = fetch_activity_pages(tokens['access_token'])
 
-    # Filter and store activities
-    for activity in activities:
-        if activity.get("type") == "Run" and activity.get("map", {}).get("summary_polyline"):
-            store_activity(user_id, activity)
+    # Store activities and fold the newly inserted ones into the per-user
+    # rarity summary in one transaction, so the summary never drifts
+    try:
+        scored = []
+        for activity in activities:
+            if is_mapped_run(activity):
+                entry = store_activity(user_id, activity)
+                if entry:
+                    scored.append(entry)
+        rarity_summary.update_summary(cursor, user_id, scored)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        logging.error(f"Failed to store activities for user {user_id}: {e}")
+        return jsonify({"error": "Failed to store activities"}), 500
+    except Exception:
+        # Never leave half a batch in the shared connection's open transaction
+        conn.rollback()
+        raise
 
     logging.info(f"Data processing complete for user {user_id}")
     return jsonify({"message": "Data processing complete"})
 
 
 def store_activity(user_id, activity):
+    """
+    Insert one activity inside the caller's transaction. Returns its
+    rarity_summary entry if it was newly inserted, or None if it already
+    existed or failed. A failed row is rolled back to a savepoint so the
+    rest of the batch still commits.
+    """
     try:
-        cursor.execute('''
-            INSERT INTO activities (user_id, activity_id, name, distance, moving_time, elapsed_time, 
-                                   total_elevation_gain, type, start_date, start_latitude, start_longitude, 
-                                   end_latitude, end_longitude, polyline, average_speed, max_speed, 
-                                   average_heartrate, max_heartrate, calories)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        values = activity_values(user_id, activity)
+    except MALFORMED_ACTIVITY_ERRORS as e:
+        logging.error(f"Failed to store activity {activity.get('id')} for user {user_id}: {e}")
+        return None
+
+    cursor.execute('SAVEPOINT store_activity')
+    try:
+        cursor.execute(f'''
+            INSERT INTO activities ({", ".join(ACTIVITY_COLUMNS)})
+            VALUES ({", ".join(["%s"] * len(ACTIVITY_COLUMNS))})
             ON CONFLICT (user_id, activity_id) DO NOTHING
-        ''', (
-            user_id,
-            activity["id"],
-            activity["name"],
-            activity["distance"],
-            activity["moving_time"],
-            activity["elapsed_time"],
-            activity["total_elevation_gain"],
-            activity["type"],
-            activity["start_date"],
-            activity.get("start_latlng", [None, None])[0],
-            activity.get("start_latlng", [None, None])[1],
-            activity.get("end_latlng", [None, None])[0],
-            activity.get("end_latlng", [None, None])[1],
-            activity["map"]["summary_polyline"],
-            activity["average_speed"],
-            activity["max_speed"],
-            activity.get("average_heartrate"),
-            activity.get("max_heartrate"),
-            activity.get("calories")
-        ))
-        conn.commit()
-        logging.info(f"Activity {activity['id']} for user {user_id} stored successfully.")
-    except Exception as e:
+            RETURNING activity_id
+        ''', values)
+        inserted = cursor.fetchone()
+        cursor.execute('RELEASE SAVEPOINT store_activity')
+    except psycopg2.Error as e:
+        cursor.execute('ROLLBACK TO SAVEPOINT store_activity')
         logging.error(f"Failed to store activity {activity['id']} for user {user_id}: {e}")
+        return None
+
+    logging.info(f"Activity {activity['id']} for user {user_id} stored successfully.")
+    if inserted:
+        return rarity_summary.scored_entry(activity, values[SCORE_INDEX])
+    return None
+
+
+@app.route("/api/rarity-summary")
+def rarity_summary_endpoint():
+    user_id = request.args.get("user_id")
+    if not user_id or not user_id.isdigit():
+        return jsonify({"error": "Missing user_id"}), 400
+
+    try:
+        cursor.execute('SELECT * FROM user_rarity_summary WHERE user_id = %s', (user_id,))
+        summary = rarity_summary.load_summary(cursor.fetchone())
+        cursor.execute('''
+            SELECT bucket, activity_count, score_sum FROM user_rarity_buckets
+            WHERE user_id = %s ORDER BY bucket
+        ''', (user_id,))
+        bucket_rows = cursor.fetchall()
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        logging.error(f"Failed to load rarity summary for user {user_id}: {e}")
+        return jsonify({"error": "Database error"}), 500
+
+    buckets = [{"month": row["bucket"].strftime("%Y-%m"),
+                "activity_count": row["activity_count"],
+                "mean_score": row["score_sum"] / row["activity_count"]}
+               for row in bucket_rows]
+
+    count = summary["activity_count"]
+    return jsonify({
+        "activity_count": count,
+        "mean_score": summary["score_sum"] / count if count else None,
+        "top_rarest": summary["top_rarest"],
+        "buckets": buckets
+    })
+
+
+@app.route("/api/rarity-rank")
+def rarity_rank():
+    user_id = request.args.get("user_id")
+    activity_id = request.args.get("activity_id")
+    if not user_id or not user_id.isdigit() or not activity_id or not activity_id.isdigit():
+        return jsonify({"error": "Missing user_id or activity_id"}), 400
+
+    try:
+        cursor.execute('''
+            SELECT rarity_score FROM activities WHERE user_id = %s AND activity_id = %s
+        ''', (user_id, activity_id))
+        activity = cursor.fetchone()
+        cursor.execute('SELECT * FROM user_rarity_summary WHERE user_id = %s', (user_id,))
+        summary = rarity_summary.load_summary(cursor.fetchone())
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        logging.error(f"Failed to rank activity {activity_id} for user {user_id}: {e}")
+        return jsonify({"error": "Database error"}), 500
+
+    if not activity or activity["rarity_score"] is None:
+        return jsonify({"error": "Activity not found"}), 404
+    score = activity["rarity_score"]
+    return jsonify({
+        "score": score,
+        "percentile": rarity_summary.percentile(summary, score),
+        "rank": rarity_summary.rank(summary, score),
+        "activity_count": summary["activity_count"]
+    })
 
 
 def handle_callback(code):
@@ -7,13 +7,120 @@ def decode_polyline(polyline_str):
     return np.array(polyline.decode(polyline_str))
 
 
-def calculate_features(polyline_str):
-    """Extract features from a polyline."""
+EARTH_RADIUS_M = 6371000.0
+
+# Default upper bound on points features are computed on. Every route in
+# data/training_data.json has fewer (426 at most), so polyline_model.pkl sees
+# unchanged features while a very detailed polyline costs no more than a
+# 500-point one. Trade-offs of tighter settings: simplification_report.py and
+# the README.
+MAX_POINTS = 500
+
+
+def haversine_distances(points):
+    """Great-circle distance in metres between consecutive (lat, lon) points."""
+    lat, lon = np.radians(points[:, 0]), np.radians(points[:, 1])
+    dlat, dlon = np.diff(lat), np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + \
+        np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def to_local_metres(points):
+    """Project (lat, lon) points onto a flat x/y plane in metres around the route."""
+    lat0 = np.radians(points[:, 0].mean())
+    lat, lon = np.radians(points[:, 0]), np.radians(points[:, 1])
+    return np.column_stack((lon * np.cos(lat0), lat)) * EARTH_RADIUS_M
+
+
+def simplify_points(points, tolerance_m):
+    """
+    Ramer-Douglas-Peucker simplification with a tolerance in metres.
+    Each split measures all of its points against the chord in one numpy call.
+    """
+    if len(points) < 3:
+        return points
+
+    xy = to_local_metres(points)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        chord = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        chord_length = np.linalg.norm(chord)
+        if chord_length == 0:  # Closed loop: fall back to distance from start
+            dists = np.linalg.norm(offsets, axis=1)
+        else:
+            dists = np.abs(chord[0] * offsets[:, 1] -
+                           chord[1] * offsets[:, 0]) / chord_length
+        i = np.argmax(dists)
+        if dists[i] > tolerance_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def resample_points(points, spacing_m=None, max_points=None):
+    """
+    Resample a route to evenly spaced points at most spacing_m metres apart
+    along its haversine length.
+    max_points caps the output size by widening the spacing on long routes;
+    with no spacing_m the route is resampled to exactly max_points points.
+    """
+    cumulative = np.concatenate(([0.0], np.cumsum(haversine_distances(points))))
+    length = cumulative[-1]
+    if length == 0:
+        return points[[0, -1]]
+
+    if spacing_m:
+        num_points = int(np.ceil(length / spacing_m)) + 1
+        if max_points:
+            num_points = min(num_points, max(max_points, 2))
+    else:
+        num_points = max(max_points, 2)
+    stations = np.linspace(0, length, num_points)
+    return np.column_stack((np.interp(stations, cumulative, points[:, 0]),
+                            np.interp(stations, cumulative, points[:, 1])))
+
+
+def preprocess_points(points, simplify_tolerance=None, resample_spacing=None,
+                      max_points=MAX_POINTS):
+    """
+    Optional stage that bounds the number of points features are computed on.
+    :param simplify_tolerance: RDP tolerance in metres, or None to skip.
+    :param resample_spacing: Resampling interval in metres, or None to skip.
+    :param max_points: Upper bound on points features are computed on. Routes
+        still longer than this after the other steps are resampled down to it.
+        None removes the bound.
+    """
+    if simplify_tolerance:
+        points = simplify_points(points, simplify_tolerance)
+    if resample_spacing or (max_points and len(points) > max_points):
+        points = resample_points(points, resample_spacing, max_points)
+    return points
+
+
+def calculate_features(polyline_str, simplify_tolerance=None,
+                       resample_spacing=None, max_points=MAX_POINTS):
+    """
+    Extract features from a polyline.
+    Defaults leave routes of up to MAX_POINTS points untouched, matching how
+    polyline_model.pkl was trained; see preprocess_points() for the options.
+    """
     # Decode the polyline
     points = decode_polyline(polyline_str)
     if len(points) < 2:
         return None  # Invalid polyline
 
+    points = preprocess_points(points, simplify_tolerance, resample_spacing,
+                               max_points)
+
     # Compute distances between consecutive points
     distances = np.linalg.norm(np.diff(points, axis=0), axis=1)
     total_length = np.sum(distances)
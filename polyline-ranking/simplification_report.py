@@ -0,0 +1,68 @@
+import json
+import time
+import numpy as np
+import pandas as pd
+from feature_extraction import calculate_features
+
+# (label, calculate_features keyword arguments); the first row is the baseline
+CONFIGS = [
+    ("raw", {"max_points": None}),
+    ("rdp 2m", {"simplify_tolerance": 2}),
+    ("rdp 5m", {"simplify_tolerance": 5}),
+    ("rdp 10m", {"simplify_tolerance": 10}),
+    ("rdp 25m", {"simplify_tolerance": 25}),
+    ("resample 10m", {"resample_spacing": 10}),
+    ("resample 25m", {"resample_spacing": 25}),
+    ("resample 50m", {"resample_spacing": 50}),
+    ("cap 500 points (default)", {}),
+    ("cap 150 points", {"max_points": 150}),
+    ("rdp 10m (<=100)", {"simplify_tolerance": 10, "max_points": 100}),
+    ("rdp 5m + resample 25m (<=200)",
+     {"simplify_tolerance": 5, "resample_spacing": 25, "max_points": 200}),
+]
+
+
+def featurize(polylines, options, repeats=3):
+    """Return the feature DataFrame and the best-of-repeats time per route in ms."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = [calculate_features(p, **options) for p in polylines]
+        best = min(best, time.perf_counter() - start)
+    return pd.DataFrame(rows), 1000 * best / len(polylines)
+
+
+def simplification_report(input_file):
+    """
+    Compare feature values and featurization time for each simplification
+    setting against the raw polylines.
+    :param input_file: Path to the training data JSON file.
+    :return: DataFrame with one row per setting.
+    """
+    with open(input_file, "r") as f:
+        polylines = [entry["polyline"] for entry in json.load(f)
+                     if entry.get("polyline")]
+
+    baseline, baseline_ms = featurize(polylines, CONFIGS[0][1])
+    report = []
+    for label, options in CONFIGS:
+        features, ms = featurize(polylines, options)
+        # Median relative change per feature, route by route
+        rel_error = (features - baseline).abs() / baseline.abs().replace(0, np.nan)
+        row = {
+            "setting": label,
+            "ms_per_route": ms,
+            "speedup": baseline_ms / ms,
+            "mean_points": features["num_points"].mean(),
+            "max_points": features["num_points"].max(),
+        }
+        for column in baseline.columns.drop("num_points"):
+            row[f"{column}_err"] = rel_error[column].median()
+        report.append(row)
+    return pd.DataFrame(report)
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 200)
+    pd.set_option("display.float_format", "{:.3f}".format)
+    print(simplification_report("data/training_data.json").to_string(index=False))
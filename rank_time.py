@@ -42,6 +42,7 @@ def get_rank(startdate):
 
 
 # Example usage
-startdate = "2025-01-27T12:02:57Z"  # ISO 8601 format
-rank = get_rank(startdate)
-print(f"The rank for the event time is {rank}.")
+if __name__ == "__main__":
+    startdate = "2025-01-27T12:02:57Z"  # ISO 8601 format
+    rank = get_rank(startdate)
+    print(f"The rank for the event time is {rank}.")
@@ -0,0 +1,210 @@
+"""
+Per-athlete rarity aggregates, updated incrementally as activities are scored.
+
+For each user we keep a fixed-bin histogram of scores, the top-k rarest
+activities and per-month counts, so "what are my rarest runs" and "where does
+this run rank" are answered from one row instead of rescoring `activities`.
+"""
+import json
+from datetime import datetime
+
+from rank_time import get_rank
+
+# Scores are time-of-day ranks from rank_time.py, 1 (common) to 5 (rarest)
+SCORE_MIN = 0.0
+SCORE_MAX = 5.0
+NUM_BINS = 50
+TOP_K = 10
+
+# Strava's start_date / start_date_local format, also used for summary entries
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def score_activity(activity):
+    """
+    Rarity score for a Strava activity, from its local start time of day.
+    This is the only scoring rule; ingestion and backfill both call it.
+    """
+    return float(get_rank(activity["start_date_local"]))
+
+
+def scored_entry(activity, score):
+    """
+    The (activity_id, score, start_date_local) tuple the summary is built
+    from. Buckets use the same local timestamp as the score.
+    """
+    return (activity["id"], score, activity["start_date_local"])
+
+
+def empty_summary():
+    return {"activity_count": 0, "score_sum": 0.0,
+            "histogram": [0] * NUM_BINS, "top_rarest": []}
+
+
+def score_bin(score):
+    width = (SCORE_MAX - SCORE_MIN) / NUM_BINS
+    return min(max(int((score - SCORE_MIN) / width), 0), NUM_BINS - 1)
+
+
+def month_bucket(start_date_local):
+    return datetime.strptime(start_date_local, DATE_FORMAT).date().replace(day=1)
+
+
+def apply_scores(summary, scored):
+    """
+    Fold newly scored activities into a summary dict (modified in place).
+    :param scored: List of (activity_id, score, start_date_local) tuples.
+        Each activity must only be applied once, i.e. on first insert.
+    """
+    for activity_id, score, start_date_local in scored:
+        summary["activity_count"] += 1
+        summary["score_sum"] += score
+        summary["histogram"][score_bin(score)] += 1
+        summary["top_rarest"].append({"activity_id": activity_id, "score": score,
+                                      "start_date_local": start_date_local})
+
+    summary["top_rarest"].sort(key=lambda a: (-a["score"], a["activity_id"]))
+    del summary["top_rarest"][TOP_K:]
+    return summary
+
+
+def bucket_totals(scored):
+    """Sum (count, score) per month for the bucket upserts."""
+    totals = {}
+    for _, score, start_date_local in scored:
+        bucket = month_bucket(start_date_local)
+        count, total = totals.get(bucket, (0, 0.0))
+        totals[bucket] = (count + 1, total + score)
+    return totals
+
+
+def percentile(summary, score):
+    """
+    Share of the user's activities (0-100) scoring below `score`, counting
+    half of those in the same histogram bin.
+    """
+    if not summary["activity_count"]:
+        return None
+    b = score_bin(score)
+    below = sum(summary["histogram"][:b]) + summary["histogram"][b] / 2
+    return 100.0 * below / summary["activity_count"]
+
+
+def rank(summary, score):
+    """Approximate 1-based rank of `score` among the user's activities, rarest first."""
+    return sum(summary["histogram"][score_bin(score) + 1:]) + 1
+
+
+def load_summary(row):
+    """Summary dict from a user_rarity_summary row (psycopg2 or asyncpg)."""
+    if not row:
+        return empty_summary()
+    top_rarest = row["top_rarest"]
+    if isinstance(top_rarest, str):  # asyncpg returns JSONB as text
+        top_rarest = json.loads(top_rarest)
+    return {"activity_count": row["activity_count"],
+            "score_sum": row["score_sum"],
+            "histogram": list(row["histogram"]),
+            "top_rarest": top_rarest}
+
+
+def lock_summary(cursor, user_id):
+    """Create the user's summary row if needed, lock it and return it as a dict."""
+    # Create the row first so FOR UPDATE has something to lock
+    cursor.execute('''
+        INSERT INTO user_rarity_summary
+            (user_id, activity_count, score_sum, histogram, top_rarest)
+        VALUES (%s, 0, 0, %s, '[]')
+        ON CONFLICT (user_id) DO NOTHING
+    ''', (user_id, [0] * NUM_BINS))
+    cursor.execute('''
+        SELECT * FROM user_rarity_summary WHERE user_id = %s FOR UPDATE
+    ''', (user_id,))
+    return load_summary(cursor.fetchone())
+
+
+def save_summary(cursor, user_id, summary):
+    cursor.execute('''
+        UPDATE user_rarity_summary
+        SET activity_count = %s, score_sum = %s, histogram = %s, top_rarest = %s::jsonb
+        WHERE user_id = %s
+    ''', (summary["activity_count"], summary["score_sum"], summary["histogram"],
+          json.dumps(summary["top_rarest"]), user_id))
+
+
+def add_buckets(cursor, user_id, scored):
+    for bucket, (count, total) in bucket_totals(scored).items():
+        cursor.execute('''
+            INSERT INTO user_rarity_buckets (user_id, bucket, activity_count, score_sum)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_id, bucket) DO UPDATE
+            SET activity_count = user_rarity_buckets.activity_count + EXCLUDED.activity_count,
+                score_sum = user_rarity_buckets.score_sum + EXCLUDED.score_sum
+        ''', (user_id, bucket, count, total))
+
+
+def update_summary(cursor, user_id, scored):
+    """
+    Apply newly scored activities to the user's summary with psycopg2.
+    The caller commits.
+    """
+    if not scored:
+        return
+    summary = apply_scores(lock_summary(cursor, user_id), scored)
+    save_summary(cursor, user_id, summary)
+    add_buckets(cursor, user_id, scored)
+
+
+def rebuild_summary(cursor, user_id):
+    """
+    Recompute the user's summary and buckets from every scored row in
+    `activities`, replacing what was there. Holds the summary row lock, so it
+    is safe to run while ingestion is live. Needs a dict-row cursor
+    (RealDictCursor); the caller commits.
+    """
+    lock_summary(cursor, user_id)
+    cursor.execute('''
+        SELECT activity_id, rarity_score, start_date_local FROM activities
+        WHERE user_id = %s AND rarity_score IS NOT NULL AND start_date_local IS NOT NULL
+    ''', (user_id,))
+    scored = [(row["activity_id"], row["rarity_score"],
+               row["start_date_local"].strftime(DATE_FORMAT))
+              for row in cursor.fetchall()]
+    save_summary(cursor, user_id, apply_scores(empty_summary(), scored))
+    cursor.execute('DELETE FROM user_rarity_buckets WHERE user_id = %s', (user_id,))
+    add_buckets(cursor, user_id, scored)
+    return len(scored)
+
+
+async def update_summary_async(db, user_id, scored):
+    """
+    Apply newly scored activities to the user's summary with asyncpg.
+    Must run inside the caller's transaction.
+    """
+    if not scored:
+        return
+    await db.execute('''
+        INSERT INTO user_rarity_summary
+            (user_id, activity_count, score_sum, histogram, top_rarest)
+        VALUES ($1, 0, 0, $2, '[]')
+        ON CONFLICT (user_id) DO NOTHING
+    ''', user_id, [0] * NUM_BINS)
+    row = await db.fetchrow('''
+        SELECT * FROM user_rarity_summary WHERE user_id = $1 FOR UPDATE
+    ''', user_id)
+    summary = apply_scores(load_summary(row), scored)
+    await db.execute('''
+        UPDATE user_rarity_summary
+        SET activity_count = $2, score_sum = $3, histogram = $4, top_rarest = $5::jsonb
+        WHERE user_id = $1
+    ''', user_id, summary["activity_count"], summary["score_sum"],
+        summary["histogram"], json.dumps(summary["top_rarest"]))
+
+    await db.executemany('''
+        INSERT INTO user_rarity_buckets (user_id, bucket, activity_count, score_sum)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (user_id, bucket) DO UPDATE
+        SET activity_count = user_rarity_buckets.activity_count + EXCLUDED.activity_count,
+            score_sum = user_rarity_buckets.score_sum + EXCLUDED.score_sum
+    ''', [(user_id, bucket, count, total)
+          for bucket, (count, total) in bucket_totals(scored).items()])
@@ -0,0 +1,99 @@
+"""
+Database schema shared by the Flask app, the async ingestion server and the
+backfill script.
+
+ALTER TABLE takes an ACCESS EXCLUSIVE lock even when the column already
+exists, which would queue every reader of `activities` behind a running
+ingestion. Columns added after a table first shipped are therefore only
+altered in when information_schema says they are missing.
+"""
+
+TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        access_token TEXT NOT NULL,
+        refresh_token TEXT NOT NULL,
+        expires_at BIGINT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS activities (
+        user_id BIGINT REFERENCES users(user_id),
+        activity_id BIGINT PRIMARY KEY,
+        name TEXT,
+        distance FLOAT,
+        moving_time INT,
+        elapsed_time INT,
+        total_elevation_gain FLOAT,
+        type TEXT,
+        start_date TIMESTAMP,
+        start_date_local TIMESTAMP,
+        start_latitude FLOAT,
+        start_longitude FLOAT,
+        end_latitude FLOAT,
+        end_longitude FLOAT,
+        polyline TEXT,
+        average_speed FLOAT,
+        max_speed FLOAT,
+        average_heartrate FLOAT,
+        max_heartrate FLOAT,
+        calories FLOAT,
+        rarity_score FLOAT,
+        UNIQUE(user_id, activity_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_rarity_summary (
+        user_id BIGINT PRIMARY KEY REFERENCES users(user_id),
+        activity_count INT NOT NULL,
+        score_sum FLOAT NOT NULL,
+        histogram INT[] NOT NULL,
+        top_rarest JSONB NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_rarity_buckets (
+        user_id BIGINT REFERENCES users(user_id),
+        bucket DATE,
+        activity_count INT NOT NULL,
+        score_sum FLOAT NOT NULL,
+        PRIMARY KEY (user_id, bucket)
+    )
+    ''',
+]
+
+# activities columns added after the table first shipped, with their types
+ADDED_ACTIVITY_COLUMNS = {
+    "start_date_local": "TIMESTAMP",
+    "rarity_score": "FLOAT",
+}
+
+EXISTING_COLUMNS_SQL = '''
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'activities'
+'''
+
+
+def missing_columns(existing):
+    return [(column, sql_type) for column, sql_type in ADDED_ACTIVITY_COLUMNS.items()
+            if column not in existing]
+
+
+def migrate(cursor):
+    """Create or upgrade the schema with psycopg2 (dict-row cursor). The caller commits."""
+    for statement in TABLES_SQL:
+        cursor.execute(statement)
+    cursor.execute(EXISTING_COLUMNS_SQL)
+    existing = {row["column_name"] for row in cursor.fetchall()}
+    for column, sql_type in missing_columns(existing):
+        cursor.execute(f'ALTER TABLE activities ADD COLUMN IF NOT EXISTS {column} {sql_type}')
+
+
+async def migrate_async(db):
+    """Create or upgrade the schema with an asyncpg connection or pool."""
+    for statement in TABLES_SQL:
+        await db.execute(statement)
+    existing = {row["column_name"] for row in await db.fetch(EXISTING_COLUMNS_SQL)}
+    for column, sql_type in missing_columns(existing):
+        await db.execute(f'ALTER TABLE activities ADD COLUMN IF NOT EXISTS {column} {sql_type}')
@@ -0,0 +1,88 @@
+"""
+Strava activity paging and row mapping shared by main.py, async_ingest.py and
+load_test.py. Nothing here touches the database, so it is safe to import
+without DATABASE_URL.
+"""
+import logging
+
+import requests
+
+import rarity_summary
+
+STRAVA_API = "https://www.strava.com/api/v3"
+
+# 10 pages of 100 activities per ingestion
+MAX_ACTIVITIES = 1000
+PER_PAGE = 100
+
+ACTIVITY_COLUMNS = (
+    "user_id", "activity_id", "name", "distance", "moving_time", "elapsed_time",
+    "total_elevation_gain", "type", "start_date", "start_date_local",
+    "start_latitude", "start_longitude",
+    "end_latitude", "end_longitude", "polyline", "average_speed", "max_speed",
+    "average_heartrate", "max_heartrate", "calories", "rarity_score"
+)
+
+SCORE_INDEX = ACTIVITY_COLUMNS.index("rarity_score")
+
+# What activity_values() raises on a malformed activity
+MALFORMED_ACTIVITY_ERRORS = (KeyError, IndexError, ValueError, TypeError)
+
+
+def is_mapped_run(activity):
+    return activity.get("type") == "Run" and bool(activity.get("map", {}).get("summary_polyline"))
+
+
+def activity_values(user_id, activity):
+    """
+    Column values for one Strava activity, in ACTIVITY_COLUMNS order.
+    Raises one of MALFORMED_ACTIVITY_ERRORS on a malformed activity.
+    """
+    return (
+        user_id,
+        activity["id"],
+        activity["name"],
+        activity["distance"],
+        activity["moving_time"],
+        activity["elapsed_time"],
+        activity["total_elevation_gain"],
+        activity["type"],
+        activity["start_date"],
+        activity["start_date_local"],
+        activity.get("start_latlng", [None, None])[0],
+        activity.get("start_latlng", [None, None])[1],
+        activity.get("end_latlng", [None, None])[0],
+        activity.get("end_latlng", [None, None])[1],
+        activity["map"]["summary_polyline"],
+        activity["average_speed"],
+        activity["max_speed"],
+        activity.get("average_heartrate"),
+        activity.get("max_heartrate"),
+        activity.get("calories"),
+        rarity_summary.score_activity(activity)
+    )
+
+
+def fetch_activity_pages(access_token, base_url=STRAVA_API, http=requests, timeout=5):
+    """
+    Page through the athlete's activities, up to MAX_ACTIVITIES, blocking the
+    calling thread on each page.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    params = {"per_page": PER_PAGE, "page": 1}
+    activities = []
+
+    while len(activities) < MAX_ACTIVITIES:
+        logging.info(f"Fetching page {params['page']}")
+        resp = http.get(f"{base_url}/athlete/activities",
+                        headers=headers, params=params, timeout=timeout)
+        if resp.status_code != 200:
+            logging.error("Failed to fetch activities")
+            break
+        chunk = resp.json()
+        if not chunk:
+            break
+        activities.extend(chunk)
+        params["page"] += 1
+
+    return activities